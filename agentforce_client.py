@@ -6,14 +6,22 @@ Agentforce API, handling authentication and Server-Sent Events (SSE).
 """
 
 import os
+import asyncio
+import contextlib
 import httpx
 import json
 import logging
-from typing import AsyncGenerator
+from collections import deque
+from typing import AsyncGenerator, NamedTuple
 from fastmcp import Context
 from auth_manager import AuthManager
 import dotenv
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 dotenv.load_dotenv()
@@ -23,6 +31,37 @@ dotenv.load_dotenv()
 SF_DOMAIN_URL = os.environ.get("SF_DOMAIN_URL")
 AGENTFORCE_BASE_URL = "https://api.salesforce.com"
 AGENT_ID = os.environ.get("AGENTFORCE_AGENT_ID")
+# Maximum number of response chunks buffered ahead of the MCP consumer
+STREAM_QUEUE_SIZE = int(os.environ.get("AGENTFORCE_STREAM_QUEUE_SIZE", 64))
+
+_START_SESSION_URL = f"/einstein/ai-agent/v1/agents/{AGENT_ID}/sessions"
+_SESSIONS_URL = "/einstein/ai-agent/v1/sessions"
+# Session fields that do not vary between calls
+_SESSION_PAYLOAD = {
+    "streamingCapabilities": {
+        "chunkTypes": ["Text"]
+    },
+    "bypassUser": False,
+    "instanceConfig": {
+        "endpoint": SF_DOMAIN_URL
+    }
+}
+
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+
+    def _json_dumps_indented(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+else:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def _json_dumps_indented(obj) -> str:
+        # Match orjson, which emits non-ASCII characters unescaped
+        return json.dumps(obj, indent=2, ensure_ascii=False)
 
 
 class AgentforceClient:
@@ -36,9 +75,15 @@ class AgentforceClient:
             auth_manager: An instance of AuthManager for handling authentication.
         """
         self.auth_manager = auth_manager
-        self.client = httpx.AsyncClient(base_url=AGENTFORCE_BASE_URL, timeout=None)
-        
+        self.client = httpx.AsyncClient(
+            base_url=AGENTFORCE_BASE_URL,
+            http2=True,
+            timeout=None,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+
     async def close(self):
+        """Closes the underlying HTTP client and its pooled connections."""
         await self.client.aclose()
 
 
@@ -60,33 +105,29 @@ class AgentforceClient:
         Raises:
             RuntimeError: If the API request fails.
         """
-        try:
-            access_token = await self.auth_manager.get_valid_token()
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                **kwargs.pop('headers', {})
-            }
-            logger.debug(f"headers = {headers}")
-            async with httpx.AsyncClient(base_url=AGENTFORCE_BASE_URL, timeout=None) as client:
-                response = await client.request(
-                    method, url, headers=headers, **kwargs)
-
-                if response.status_code == 401:
-                    logger.warning(
-                        "⚠️ Token expired (401). Attempting token refresh...")
-                    await self.auth_manager._fetch_new_token()
-
-                    access_token = await self.auth_manager.get_valid_token()
-                    headers["Authorization"] = f"Bearer {access_token}"
-                    response = await client.request(
-                        method, url, headers=headers, **kwargs)
+        access_token = self.auth_manager.token_if_valid() or await self.auth_manager.get_valid_token()
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            **kwargs.pop('headers', {})
+        }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("headers = %s", headers)
+        response = await self.client.request(
+            method, url, headers=headers, **kwargs)
 
-                response.raise_for_status()
-                return response
+        if response.status_code == 401:
+            logger.warning(
+                "⚠️ Token expired (401). Attempting token refresh...")
+            access_token = await self.auth_manager._fetch_new_token(rejected_token=access_token)
+            headers["Authorization"] = f"Bearer {access_token}"
+            response = await self.client.request(
+                method, url, headers=headers, **kwargs)
 
-        except httpx.HTTPStatusError as e:
+        if not response.is_success:
+            # Truncate so an oversized error body can't flood the logs
             raise RuntimeError(
-                f"Agentforce API HTTP Error {e.response.status_code}: {e.response.text}") from e
+                f"Agentforce API HTTP Error {response.status_code}: {response.text[:512]}")
+        return response
 
     async def start_session(self, uuid: str) -> str:
         """
@@ -98,27 +139,51 @@ class AgentforceClient:
         Returns:
             The session ID.
         """
-        url = f"/einstein/ai-agent/v1/agents/{AGENT_ID}/sessions"
-        payload = {
-            "externalSessionKey": uuid,
-            "streamingCapabilities": {
-                "chunkTypes": ["Text"]
-            },
-            "bypassUser": False,
-            "instanceConfig": {
-                "endpoint": SF_DOMAIN_URL
-            }
-        }
-        response = await self._authenticated_request("POST", url, json=payload, headers={"Content-Type": "application/json"})
+        payload = {"externalSessionKey": uuid, **_SESSION_PAYLOAD}
+        response = await self._authenticated_request("POST", _START_SESSION_URL, content=_json_dumps_bytes(payload), headers={"Content-Type": "application/json"})
         return response.json().get("sessionId")
 
+    @staticmethod
+    async def _iter_sse_lines(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+        """
+        Splits a streaming response body into SSE lines.
+
+        Raw bytes are accumulated in a buffer and split on newlines, which is
+        considerably cheaper than httpx's own per-chunk line decoding on a
+        high-rate stream. Lines are left undecoded so the JSON parser can
+        consume them directly.
+
+        Args:
+            response: The streaming HTTP response.
+
+        Yields:
+            Each line of the response body as bytes, without its line terminator.
+        """
+        buf = bytearray()
+        async for chunk in response.aiter_bytes():
+            buf.extend(chunk)
+            while (i := buf.find(b"\n")) != -1:
+                line = bytes(buf[:i])
+                del buf[:i + 1]
+                if line.endswith(b"\r"):
+                    line = line[:-1]
+                yield line
+        if buf:
+            yield bytes(buf).rstrip(b"\r")
+
     async def stream_message(self, session_id: str, message: str, ctx: Context | None) -> AsyncGenerator[str, None]:
         """
         Streams a message to the Agentforce Agent and yields the response chunks.
 
         This method sends a message to the specified session and processes the
         Server-Sent Events (SSE) stream from the response, yielding the text
-        chunks as they are received.
+        chunks as they are received. Answers to agent inquiries are queued and
+        sent as follow-up messages on the same session, one stream at a time.
+
+        The SSE stream is read by a background task into a bounded queue. When
+        the consumer falls behind and the queue fills up, the reader stops
+        pulling from the socket, so backpressure reaches the server instead of
+        the stream being buffered in memory.
 
         Args:
             session_id: The ID of the session.
@@ -128,58 +193,99 @@ class AgentforceClient:
         Yields:
             Response chunks from the Agentforce Agent.
         """
-        url = f"/einstein/ai-agent/v1/sessions/{session_id}/messages/stream"
-        payload = {
-            "message": {"sequenceId": 1, "type": "Text", "text": message}
-        }
-        access_token = await self.auth_manager.get_valid_token()
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream"
-        }
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        consumer_done = False
+
+        async def produce():
+            outcome: object = _QUEUE_DONE
+            try:
+                await self._sse_reader(session_id, message, ctx, queue)
+            except BaseException as e:
+                outcome = e
+                if consumer_done:
+                    raise
+            finally:
+                # Always wake the consumer, unless it has already stopped reading
+                if not consumer_done:
+                    await queue.put(outcome)
+
+        reader = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not _QUEUE_DONE:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            consumer_done = True
+            if not reader.done():
+                reader.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await reader
 
-        logger.info(f"Sending message '{message}' on session '{session_id}")
-        async with httpx.AsyncClient(base_url=AGENTFORCE_BASE_URL, timeout=None) as client:
-            async with client.stream("POST", url, json=payload, headers=headers) as response:
+    async def _sse_reader(self, session_id: str, message: str, ctx: Context | None, queue: asyncio.Queue):
+        """
+        Sends messages on a session and puts the parsed response chunks on a queue.
+
+        Args:
+            session_id: The ID of the session.
+            message: The first message to send to the agent.
+            ctx: The FastMCP context for logging and interaction.
+            queue: The bounded queue that stream_message consumes from.
+        """
+        url = f"{_SESSIONS_URL}/{session_id}/messages/stream"
+        pending: deque[str] = deque([message])
+
+        while pending:
+            message = pending.popleft()
+            payload = {
+                "message": {"sequenceId": 1, "type": "Text", "text": message}
+            }
+            access_token = self.auth_manager.token_if_valid() or await self.auth_manager.get_valid_token()
+            headers = {
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream"
+            }
+
+            logger.info(f"Sending message '{message}' on session '{session_id}")
+            async with self.client.stream("POST", url, content=_json_dumps_bytes(payload), headers=headers) as response:
                 response.raise_for_status()
-                async for line in response.aiter_lines():
-                    logger.debug(f"RAW LINE: {line}")
-                    if line.startswith("data:"):
+                async for line in self._iter_sse_lines(response):
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("RAW LINE: %s", line.decode("utf-8", "replace"))
+                    # Skip blank separators and SSE comment lines
+                    if not line or line.startswith(b":"):
+                        continue
+                    if line.startswith(b"data:"):
+                        data = line[5:].lstrip()
+                        if not data or data == b"[DONE]":
+                            continue
                         try:
-                            events = json.loads(line.lstrip("data:").strip())
-                            for event in events:
-                                if (event == "message"):
-                                    if events[event].get("type") == "TextChunk":
-                                        yield events[event]["message"]
-                                    elif events[event].get("type") == "Inform":
-                                        logger.debug(
-                                            f"message =  {events[event]['result']}")
-                                        yield "\n\n" + json.dumps(events[event]["result"], indent=2)
-                                    elif events[event].get("type") == "ProgressIndicator":
-                                        if ctx:
-                                            await ctx.info(f"ProgressIndicator = {events[event]['message']}")
-                                    elif events[event].get("type") == "Inquire":
-                                        logger.info(
-                                            f"INQUIRY: {events[event]['message']}")
-                                        if ctx: 
-                                            elicitation = await ctx.elicit(events[event]['message'], response_type=str)
-                                            if elicitation.action == "accept":
-                                                logger.info(f"elicitation accepted.  response = {elicitation.data}")
-                                                yield f"\n\n{elicitation.data}\n\n"
-                                                async for chunk in self.stream_message(session_id, elicitation.data, ctx):
-                                                    yield chunk
-                                            elif elicitation.action == "decline":
-                                                logger.info("elicitation declined.")
-                                                return
-                                            else:
-                                                return
-
-                        except json.JSONDecodeError:
+                            events = _json_loads(data)
+                        except ValueError:  # JSONDecodeError, or invalid UTF-8 with stdlib json
                             logger.warning(
                                 "Encountered non JSON data processing SSE event starting with 'data:'.  That shouldn't happen. ")
                             continue
 
+                        # Only JSON objects carry a message; skip arrays and scalars
+                        if not isinstance(events, dict):
+                            continue
+                        event = events.get("message")
+                        if not event:
+                            continue
+                        handler = HANDLERS.get(event.get("type"))
+                        if handler:
+                            async for out in handler(self, event, ctx, session_id):
+                                if out is _END_STREAM:
+                                    return
+                                if isinstance(out, _FollowUp):
+                                    pending.append(out.message)
+                                    break
+                                await queue.put(out)
+                        if pending:
+                            break
+
     async def end_session(self, session_id: str):
         """
         Ends the specified session.
@@ -187,8 +293,75 @@ class AgentforceClient:
         Args:
             session_id: The ID of the session to end.
         """
-        url = f"/einstein/ai-agent/v1/sessions/{session_id}"
+        url = f"{_SESSIONS_URL}/{session_id}"
         await self._authenticated_request("DELETE", url, headers={"x-session-end-reason": "UserRequest"})
-        
-    async def __exit__(self, exc_type, exc_value, traceback):
-        await self.client.aclose()
\ No newline at end of file
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+# --- 2. SSE Event Handlers ---
+
+# Yielded by a handler to stop the current stream_message call.
+_END_STREAM = object()
+
+# Put on the stream_message queue by the reader task once it has finished.
+_QUEUE_DONE = object()
+
+
+class _FollowUp(NamedTuple):
+    """Yielded by a handler to send another message on the same session."""
+    message: str
+
+
+async def _handle_text(client: AgentforceClient, event: dict, ctx: Context | None, session_id: str):
+    """Yields the text of a TextChunk event."""
+    yield event["message"]
+
+
+async def _handle_inform(client: AgentforceClient, event: dict, ctx: Context | None, session_id: str):
+    """Yields the formatted result of an Inform event."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("message =  %s", event['result'])
+    yield "\n\n" + _json_dumps_indented(event["result"])
+
+
+async def _handle_progress(client: AgentforceClient, event: dict, ctx: Context | None, session_id: str):
+    """Forwards a ProgressIndicator event to the MCP client as an info log."""
+    if ctx:
+        await ctx.info(f"ProgressIndicator = {event['message']}")
+    return
+    yield
+
+
+async def _handle_inquire(client: AgentforceClient, event: dict, ctx: Context | None, session_id: str):
+    """
+    Elicits an answer to an Inquire event from the MCP client.
+
+    An accepted answer is echoed and queued as a follow-up message on the
+    same session. A declined or cancelled elicitation ends the stream.
+    """
+    logger.info(
+        f"INQUIRY: {event['message']}")
+    if ctx:
+        elicitation = await ctx.elicit(event['message'], response_type=str)
+        if elicitation.action == "accept":
+            logger.info(f"elicitation accepted.  response = {elicitation.data}")
+            yield f"\n\n{elicitation.data}\n\n"
+            yield _FollowUp(elicitation.data)
+        elif elicitation.action == "decline":
+            logger.info("elicitation declined.")
+            yield _END_STREAM
+        else:
+            yield _END_STREAM
+
+
+HANDLERS = {
+    "TextChunk": _handle_text,
+    "Inform": _handle_inform,
+    "ProgressIndicator": _handle_progress,
+    "Inquire": _handle_inquire,
+}
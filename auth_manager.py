@@ -7,6 +7,7 @@ tokens using the Client Credentials flow.
 
 import os
 import time
+import asyncio
 import httpx
 from typing import Optional
 import logging
@@ -31,6 +32,14 @@ class AuthManager:
         self.token_url = token_url
         self._access_token: Optional[str] = None
         self._expires_at: float = 0.0
+        # Incremented on every successful token fetch
+        self._generation: int = 0
+        self._client = httpx.AsyncClient(http2=True)
+        self._refresh_lock = asyncio.Lock()
+
+    async def close(self):
+        """Closes the underlying HTTP client used for token requests."""
+        await self._client.aclose()
 
     async def get_valid_token(self) -> str | None:
         """
@@ -42,18 +51,58 @@ class AuthManager:
         Returns:
             A valid access token, or None if a token could not be obtained.
         """
+        token = self.token_if_valid()
+        if token:
+            return token
+
+        return await self._fetch_new_token()
+
+    def token_if_valid(self) -> str | None:
+        """
+        Returns the cached access token without awaiting.
+
+        This lets callers skip the coroutine path entirely in the common case
+        where the cached token is still valid.
+
+        Returns:
+            The cached access token, or None if it is missing or about to expire.
+        """
         if self._access_token and self._expires_at > time.time() + 60:  # Refresh 60s before actual expiry
             return self._access_token
+        return None
 
-        await self._fetch_new_token()
-        return self._access_token
-
-    async def _fetch_new_token(self):
+    async def _fetch_new_token(self, rejected_token: str | None = None) -> str | None:
         """
         Executes the OAuth 2.0 Client Credentials flow to get a new token.
 
         This method makes a POST request to the Salesforce token endpoint to
-        obtain a new access token, which is then cached.
+        obtain a new access token, which is then cached. Concurrent callers are
+        serialized on a lock, and any caller that finds another caller already
+        fetched a token while it waited reuses that token instead of
+        refreshing again.
+
+        Args:
+            rejected_token: The token the API just rejected, if any. A cached
+                token that differs from it is reused without refreshing.
+
+        Returns:
+            The newly cached access token.
+
+        Raises:
+            RuntimeError: If the token acquisition fails.
+        """
+        generation = self._generation
+        async with self._refresh_lock:
+            token = self.token_if_valid()
+            if token and (self._generation != generation
+                          or (rejected_token is not None and token != rejected_token)):
+                return token
+            await self._request_token()
+            return self._access_token
+
+    async def _request_token(self):
+        """
+        Posts the Client Credentials grant and caches the resulting token.
 
         Raises:
             RuntimeError: If the token acquisition fails.
@@ -66,21 +115,21 @@ class AuthManager:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.token_url,
-                    data=auth_payload,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"}
-                )
-                response.raise_for_status()
-                token_data = response.json()
-
-                self._access_token = token_data["access_token"]
-                expires_in = token_data.get("expires_in", 3600)
-                self._expires_at = time.time() + expires_in
-
-                print(
-                    f"✅ New Salesforce access token acquired. Expires in {expires_in}s.")
+            response = await self._client.post(
+                self.token_url,
+                data=auth_payload,
+                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            response.raise_for_status()
+            token_data = response.json()
+
+            self._access_token = token_data["access_token"]
+            expires_in = token_data.get("expires_in", 3600)
+            self._expires_at = time.time() + expires_in
+            self._generation += 1
+
+            print(
+                f"✅ New Salesforce access token acquired. Expires in {expires_in}s.")
 
         except httpx.HTTPStatusError as e:
             raise RuntimeError(
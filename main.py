@@ -7,25 +7,34 @@ configuration, authentication, and the streaming of responses back to the client
 """
 
 import os
-import uuid
+import sys
 import logging
+from secrets import token_hex
+from contextlib import asynccontextmanager
 import dotenv
+import uvicorn
 from fastmcp import FastMCP, Context
-from pydantic import BaseModel, Field
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from pydantic import BaseModel, ConfigDict, Field
 from auth_manager import AuthManager
 from agentforce_client import AgentforceClient
 
 dotenv.load_dotenv()
 
 # --- Logging Setup ---
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+_log_level_valid = LOG_LEVEL in logging.getLevelNamesMapping()
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL if _log_level_valid else logging.INFO,
     format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
     handlers=[
         logging.StreamHandler(),
     ]
 )
 logger = logging.getLogger(__name__)
+if not _log_level_valid:
+    logger.warning(f"Unknown LOG_LEVEL '{LOG_LEVEL}'; falling back to INFO.")
 
 # --- 1. Configuration & Constants ---
 
@@ -34,6 +43,8 @@ SF_DOMAIN_URL = os.environ.get("SF_DOMAIN_URL")
 SF_CLIENT_ID = os.environ.get("SF_CLIENT_ID","NOT_SET")
 SF_CLIENT_SECRET = os.environ.get("SF_CLIENT_SECRET","NOT_SET")
 PORT = os.environ.get("PORT",8000)
+# Echo streamed chunks to stdout as they arrive (for debugging)
+_CHUNK_DEBUG = os.environ.get("AF_DEBUG_CHUNKS") == "1"
 SF_TOKEN_URL = f"{SF_DOMAIN_URL}/services/oauth2/token"
 
 # --- 2. FastMCP Server and Tool Definition ---
@@ -41,9 +52,12 @@ SF_TOKEN_URL = f"{SF_DOMAIN_URL}/services/oauth2/token"
 auth_manager = AuthManager(SF_CLIENT_ID, SF_CLIENT_SECRET, SF_TOKEN_URL)
 agentforce_client = AgentforceClient(auth_manager)
 
+
 mcp = FastMCP("AgentforceOAuthStreamingBridge")
 
 class AskAgentforceStreamingInput(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True, validate_assignment=False)
+
     user_query: str = Field(..., description="The complete question or request for the Agentforce Agent.")
 
 async def ask_agentforce_stream(
@@ -65,8 +79,8 @@ async def ask_agentforce_stream(
         Response chunks from the Agentforce Agent.
     """
     user_query = input_data.user_query
-    # Use uuid.uuid4() to generate a random externalSessionKey
-    user_key = str(uuid.uuid4())
+    # Use a random hex token as the externalSessionKey
+    user_key = token_hex(16)
     
     session_id = None
 
@@ -122,32 +136,62 @@ async def run_ask_agentforce_stream(
     Returns:
         The full response from the Agentforce Agent.
     """
-    full_response = ""
-    print("Starting testme execution...")
+    parts: list[str] = []
     # The 'async for' loop is what consumes the asynchronous generator
     async for chunk in ask_agentforce_stream(input_data,ctx):
-        full_response += chunk
-        # Optional: print chunks as they arrive for debugging
-        print(f"Chunk received: {chunk}", end="", flush=True)
-        
-    return full_response
+        parts.append(chunk)
+        # Optional: echo chunks as they arrive for debugging
+        if _CHUNK_DEBUG:
+            sys.stdout.write(chunk)
+
+    if _CHUNK_DEBUG:
+        sys.stdout.flush()
+    return "".join(parts)
   
 # --- 5. Running the FastMCP Server ---
 
-if __name__ == "__main__":
-    # Ensure a valid token is available before starting the server
+mcp_app = mcp.http_app(transport="streamable-http")
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """
+    Manages server startup and shutdown.
+
+    A token is fetched on the server's own event loop before requests are
+    accepted, so the pooled OAuth and Agentforce connections opened here are
+    the ones used for request handling. Both clients are closed on shutdown.
+
+    This wraps the Starlette app rather than using FastMCP's lifespan, which
+    runs once per MCP session rather than once per server.
+
+    Args:
+        app: The Starlette application.
+    """
     try:
-        # NOTE: Using synchronous _fetch_new_token for pre-start check.
-        # This will still block and may show the ConnectError here, but the rest of the application logic is fixed.
-        import asyncio
-        asyncio.run(auth_manager._fetch_new_token())
-        
-    except Exception as e:
-        print(f"FATAL: Initial Salesforce authentication failed. Please check credentials.")
-        print(e)
-        exit(1)
-        
+        async with agentforce_client:
+            try:
+                await auth_manager._fetch_new_token()
+            except Exception as e:
+                print(f"FATAL: Initial Salesforce authentication failed. Please check credentials.")
+                print(e)
+                raise
+
+            async with mcp_app.lifespan(app):
+                yield
+    finally:
+        await auth_manager.close()
+
+app = Starlette(routes=[Mount("/", app=mcp_app)], lifespan=lifespan)
+
+if __name__ == "__main__":
     print("FastMCP Agentforce Streaming Bridge Server is starting...")
-    
-    # Run using the Streamable HTTP transport
-    mcp.run(transport='streamable-http', port=PORT)
\ No newline at end of file
+
+    # Run using the Streamable HTTP transport. Like FastMCP's own runner, don't
+    # wait on long-lived streams at shutdown so the lifespan cleanup always runs.
+    uvicorn.run(
+        app,
+        port=int(PORT),
+        timeout_graceful_shutdown=0,
+        log_level=logging.getLogger().level,
+    )